@@ -55,6 +55,66 @@ class Graph:
         list(self.traverse(visited=visited))
         return all(v == 1 for v in visited.values())
 
+    def strongly_connected_components(self):
+        """Find the strongly connected components of this graph.
+
+        This is an iterative version of Tarjan's algorithm, so deep graphs do
+        not run into Python's recursion limit.
+
+        Return:
+            (list): lists of nodes, one per component. Components are in
+                reverse topological order: every component comes after all
+                components reachable from it.
+        """
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+
+        for root in sorted(self.roots, key=traversal_order):
+            if id(root) in index:
+                continue
+
+            index[id(root)] = lowlink[id(root)] = len(index)
+            stack.append(root)
+            on_stack.add(id(root))
+            work = [(root, iter(root.children))]
+
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if id(child) not in index:
+                        # descend into child, resume node's children later
+                        index[id(child)] = lowlink[id(child)] = len(index)
+                        stack.append(child)
+                        on_stack.add(id(child))
+                        work.append((child, iter(child.children)))
+                        break
+                    elif id(child) in on_stack:
+                        lowlink[id(node)] = min(lowlink[id(node)], index[id(child)])
+                else:
+                    # all children of node are done
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[id(parent)] = min(
+                            lowlink[id(parent)], lowlink[id(node)]
+                        )
+
+                    if lowlink[id(node)] == index[id(node)]:
+                        # node is the root of a component
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(id(member))
+                            component.append(member)
+                            if member is node:
+                                break
+                        components.append(component)
+
+        return components
+
     def find_merges(self):
         """Find nodes that have the same parent and frame.
 
@@ -333,16 +393,10 @@ class Graph:
             _iter_depth(root, visited)
 
     def enumerate_traverse(self):
-        if not self._check_enumerate_traverse():
-            for i, node in enumerate(self.traverse()):
-                node._hatchet_nid = i
-
-            self.enumerate_depth()
-
-    def _check_enumerate_traverse(self):
         for i, node in enumerate(self.traverse()):
-            if i != node._hatchet_nid:
-                return False
+            node._hatchet_nid = i
+
+        self.enumerate_depth()
 
     def __len__(self):
         """Size of the graph in terms of number of nodes."""
@@ -4,17 +4,17 @@
 # SPDX-License-Identifier: MIT
 
 import copy
+import os
 import sys
 import traceback
 
-from collections import defaultdict
+from collections import namedtuple
 
 import pandas as pd
 import numpy as np
-import multiprocess as mp
 import json
 
-from .node import Node
+from .node import Node, MultiplePathError
 from .graph import Graph
 from .frame import Frame
 from .query import (
@@ -27,6 +27,7 @@ from .query import (
 from .external.console import ConsoleRenderer
 from .util.dot import trees_to_dot
 from .util.deprecated import deprecated_params
+from .util.numba_kernels import generate_filter_kernel, get_arg_names
 
 try:
     from .cython_modules.libs import graphframe_modules as _gfm_cy
@@ -40,12 +41,116 @@ except ImportError:
     raise
 
 
-def parallel_apply(filter_function, dataframe, queue):
-    """A function called in parallel, which does a pandas apply on part of a
-    dataframe and returns the results via multiprocessing queue function."""
-    filtered_rows = dataframe.apply(filter_function, axis=1)
-    filtered_df = dataframe[filtered_rows]
-    queue.put(filtered_df)
+def init_parallel_apply(filter_function_, dataframe_):
+    """Initialize the filter function and dataframe of a filter worker."""
+    global shared_filter_function, shared_dataframe
+    shared_filter_function = filter_function_
+    shared_dataframe = dataframe_
+
+
+def parallel_apply(bounds):
+    """A function called in parallel, which does a pandas apply on the rows
+    ``start:stop`` of the shared dataframe and returns the resulting boolean
+    mask.
+
+    Only the mask is sent back to the parent, which is much cheaper to pickle
+    than the filtered rows themselves.
+    """
+    start, stop = bounds
+    dataframe = shared_dataframe.iloc[start:stop]
+    if dataframe.empty:
+        return np.zeros(0, dtype=bool)
+    return np.asarray(dataframe.apply(shared_filter_function, axis=1), dtype=bool)
+
+
+# positions of dataframe rows in the dense arrays used by subtree_sum and
+# subgraph_sum: node_pos maps id(node) to its position in the array,
+# nodes/groups are the array coordinates of the rows selected by in_graph,
+# and positions holds the row number at each coordinate (-1 if missing).
+SumRows = namedtuple(
+    "SumRows", ["node_pos", "nodes", "groups", "in_graph", "positions"]
+)
+
+# numpy equivalents of the dataframe operators used by the arithmetic
+# operators, for columns that are already aligned
+_OPERATOR_UFUNCS = {
+    "add": np.add,
+    "sub": np.subtract,
+    "div": np.true_divide,
+    "divide": np.true_divide,
+    "mul": np.multiply,
+    "multiply": np.multiply,
+}
+
+# above this many metrics, _operator rebuilds the dataframe rather than
+# replacing the metric columns one at a time
+_OPERATOR_MAX_SETITEM = 8
+
+
+def _sum_min_count(x):
+    """Default aggregation for subtree_sum and subgraph_sum.
+
+    Uses min_count=1 so that the sum of an all-NA series is NaN, not 0.
+    """
+    return x.sum(min_count=1)
+
+
+def _node_mask(index, nodes):
+    """Boolean mask of the rows of index whose node is in nodes.
+
+    For a MultiIndex, membership is only tested once per unique node of the
+    "node" level instead of once per row.
+    """
+    if isinstance(index, pd.MultiIndex):
+        level = index.names.index("node")
+        return index.levels[level].isin(nodes)[index.codes[level]]
+    return index.isin(nodes)
+
+
+def _first_rows(dataframe, columns, keys, index):
+    """Values of columns in the first row of each group of dataframe.
+
+    Same as ``groupby(...).agg(lambda x: x.iloc[0])``, which, unlike
+    ``first``, keeps NaN values, but without calling Python once per group.
+
+    Arguments:
+        keys (Index): group key of each row of dataframe
+        index (Index): group keys of the result
+    """
+    first = ~keys.duplicated()
+    result = dataframe.loc[first, columns]
+    result.index = keys[first]
+    return result.reindex(index)
+
+
+def _children_csr(nodes, node_pos):
+    """Children of each node in compressed sparse row form.
+
+    The children of ``nodes[i]`` are ``child_pos[indptr[i]:indptr[i + 1]]``,
+    as positions given by ``node_pos``, a dict from ``id(node)``.
+    """
+    child_pos = np.fromiter(
+        (node_pos[id(child)] for node in nodes for child in node.children),
+        dtype=np.intp,
+    )
+    num_children = np.fromiter(
+        (len(node.children) for node in nodes), dtype=np.intp, count=len(nodes)
+    )
+    indptr = np.concatenate(([0], np.cumsum(num_children)))
+    return child_pos, indptr
+
+
+def _csr_entries(indptr, parents):
+    """Entries of a CSR array for some of its rows.
+
+    Return:
+        entries (ndarray): indices of the entries of ``parents``, in order
+        starts (ndarray): offset of each parent's first entry in ``entries``
+    """
+    lengths = indptr[parents + 1] - indptr[parents]
+    starts = np.cumsum(lengths) - lengths
+    entries = np.arange(lengths.sum()) + np.repeat(indptr[parents] - starts, lengths)
+    return entries, starts
 
 
 class GraphFrame:
@@ -299,11 +404,19 @@ class GraphFrame:
         graph = Graph.from_lists(*lists)
         graph.enumerate_traverse()
 
-        df = pd.DataFrame({"node": list(graph.traverse())})
-        df["time"] = [1.0] * len(graph)
-        df["name"] = [n.frame["name"] for n in graph.traverse()]
+        nodes = list(graph.traverse())
+        df = pd.DataFrame(
+            {
+                "node": nodes,
+                "time": np.ones(len(nodes)),
+                "name": [n.frame["name"] for n in nodes],
+            }
+        )
         df.set_index(["node"], inplace=True)
-        df.sort_index(inplace=True)
+        # enumerate_traverse numbers nodes in traversal order, so the index
+        # is normally sorted already
+        if not df.index.is_monotonic_increasing:
+            df.sort_index(inplace=True)
 
         gf = GraphFrame(graph, df, ["time"], [])
         gf.update_inclusive_columns()
@@ -376,7 +489,7 @@ class GraphFrame:
         index_names = dataframe_copy.index.names
         dataframe_copy.reset_index(inplace=True)
 
-        dataframe_copy["node"] = dataframe_copy["node"].apply(lambda x: node_clone[x])
+        dataframe_copy["node"] = dataframe_copy["node"].map(node_clone)
 
         dataframe_copy.set_index(index_names, inplace=True)
 
@@ -394,28 +507,34 @@ class GraphFrame:
         index_names = list(self.dataframe.index.names)
         index_names.remove("node")
 
-        # create dict that stores aggregation function for each column
-        agg_dict = {}
-        for col in self.dataframe.columns.tolist():
-            if col in self.exc_metrics + self.inc_metrics:
-                agg_dict[col] = function
-            else:
-                agg_dict[col] = lambda x: x.iloc[0]
+        columns = self.dataframe.columns.tolist()
+        metrics = [c for c in columns if c in self.exc_metrics + self.inc_metrics]
+        others = [c for c in columns if c not in metrics]
 
-        # perform a groupby to merge nodes that just differ in index columns
-        self.dataframe.reset_index(level="node", inplace=True)
-        agg_df = self.dataframe.groupby("node").agg(agg_dict)
+        # perform a groupby to merge nodes that just differ in index columns:
+        # metrics are aggregated with function, other columns keep the value
+        # of the first row of each node
+        agg_df = self.dataframe.groupby(level="node")[metrics].agg(function)
+        first_df = _first_rows(
+            self.dataframe,
+            others,
+            self.dataframe.index.get_level_values("node"),
+            agg_df.index,
+        )
 
-        self.dataframe = agg_df
+        self.dataframe = pd.concat([agg_df, first_df], axis=1)[columns]
 
     def filter(
         self,
         filter_obj,
         squash=True,
         update_inc_cols=True,
-        num_procs=mp.cpu_count(),
+        num_procs=None,
         rec_limit=1000,
         multi_index_mode="off",
+        vectorized=False,
+        engine="python",
+        engine_kwargs=None,
     ):
         """Filter the dataframe using a user-supplied function.
 
@@ -425,49 +544,118 @@ class GraphFrame:
             filter_obj (callable, list, or QueryMatcher): the filter to apply to the GraphFrame.
             squash (boolean, optional): if True, automatically call squash for the user.
             update_inc_cols (boolean, optional): if True, update inclusive columns when performing squash.
-            rec_limit: set Python recursion limit, increase if running into
-                recursion depth errors) (default: 1000).
+            num_procs (int, optional): number of processes used to apply a
+                callable row by row (default: number of CPUs).
+            rec_limit: raise Python recursion limit to at least this value,
+                increase if running into recursion depth errors (default: 1000).
+            vectorized (boolean, optional): if True, the callable is invoked
+                once on the whole (index-reset) dataframe instead of once per
+                row, and must return a boolean mask with one entry per row,
+                e.g., ``lambda df: df["time"] > 5.0``. This avoids building a
+                Series for every row and is much faster on large dataframes
+                (default: False).
+            engine (str, optional): "python" or "numba". With "numba", the
+                callable must be a scalar predicate taking one value per
+                column, e.g., ``lambda time: time > 5.0``. It is compiled with
+                numba and evaluated over the column arrays in a single loop,
+                without spawning processes (default: "python").
+            engine_kwargs (dict, optional): options for the numba engine:
+                "columns" (list of numeric or boolean column names passed
+                positionally to the predicate; defaults to the predicate's
+                argument names), and "nopython", "nogil" and "parallel" which
+                are passed to ``numba.jit`` (default: True, True, False).
+                Enabling "parallel" starts numba's thread pool, after which
+                forking processes, e.g., parallel filters or the HPCToolkit
+                reader, can hang the interpreter.
         """
-        sys.setrecursionlimit(rec_limit)
+        if rec_limit > sys.getrecursionlimit():
+            sys.setrecursionlimit(rec_limit)
 
-        dataframe_copy = self.dataframe.copy()
+        if num_procs is None:
+            num_procs = os.cpu_count() or 1
 
         index_names = self.dataframe.index.names
-        dataframe_copy.reset_index(inplace=True)
 
         filtered_df = None
 
+        if engine not in ("python", "numba"):
+            raise ValueError("engine must be one of 'python' or 'numba'")
+
         if callable(filter_obj):
+            # callables see the index levels as columns; reset_index returns
+            # a new dataframe, so this also copies it
+            dataframe_copy = self.dataframe.reset_index()
+
+        if callable(filter_obj) and engine == "numba":
+            if engine_kwargs is None:
+                engine_kwargs = {}
+            columns = engine_kwargs.get("columns")
+            if columns is None:
+                columns = get_arg_names(filter_obj)
+            elif len(columns) != len(get_arg_names(filter_obj)):
+                raise ValueError(
+                    "A numba filter must take one argument per column: %s" % columns
+                )
+            if not columns or any(c not in dataframe_copy.columns for c in columns):
+                raise ValueError(
+                    "The columns passed to a numba filter must be dataframe "
+                    "columns: %s" % columns
+                )
+            for c in columns:
+                if not pd.api.types.is_numeric_dtype(dataframe_copy[c]):
+                    raise ValueError(
+                        "numba filters only support numeric or boolean columns, "
+                        "but column '%s' has dtype %s" % (c, dataframe_copy[c].dtype)
+                    )
+            kernel = generate_filter_kernel(
+                filter_obj,
+                len(columns),
+                engine_kwargs.get("nopython", True),
+                engine_kwargs.get("nogil", True),
+                engine_kwargs.get("parallel", False),
+            )
+            filtered_rows = kernel(*[dataframe_copy[c].to_numpy() for c in columns])
+            filtered_df = dataframe_copy[filtered_rows]
+
+        elif callable(filter_obj) and vectorized:
+            # evaluate the filter on whole columns and index with a single mask
+            filtered_rows = np.asarray(filter_obj(dataframe_copy), dtype=bool)
+            if filtered_rows.shape != (len(dataframe_copy),):
+                raise InvalidFilter(
+                    "A vectorized filter must return a boolean mask with one "
+                    "entry per row of the dataframe."
+                )
+            filtered_df = dataframe_copy[filtered_rows]
+
+        elif callable(filter_obj):
             # applying pandas filter using the callable function
             if num_procs > 1:
                 # perform filter in parallel (default)
-                queue = mp.Queue()
-                processes = []
-                returned_frames = []
-                subframes = np.array_split(dataframe_copy, num_procs)
-
-                # Manually create a number of processes equal to the number of
-                # logical cpus available
-                for pid in range(num_procs):
-                    process = mp.Process(
-                        target=parallel_apply,
-                        args=(filter_obj, subframes[pid], queue),
+                # import this lazily, it is only needed for parallel filters
+                import multiprocess as mp
+
+                # The workers inherit the filter and the dataframe when the
+                # pool is created, so only the row ranges to filter and the
+                # resulting boolean masks are sent between processes. There
+                # are a few ranges per worker to balance the load.
+                num_chunks = num_procs * 4
+                bounds = np.linspace(0, len(dataframe_copy), num_chunks + 1, dtype=int)
+
+                pool = mp.Pool(
+                    num_procs,
+                    initializer=init_parallel_apply,
+                    initargs=(filter_obj, dataframe_copy),
+                )
+                try:
+                    # imap returns the masks in the order of the row ranges
+                    returned_masks = list(
+                        pool.imap(parallel_apply, zip(bounds[:-1], bounds[1:]))
                     )
-                    process.start()
-                    processes.append(process)
-
-                # Stores filtered subframes in a list: 'returned_frames', for
-                # pandas concatenation. This intermediary list is used because
-                # pandas concat is faster when called only once on a list of
-                # dataframes, than when called multiple times appending onto a
-                # frame of increasing size.
-                for pid in range(num_procs):
-                    returned_frames.append(queue.get())
+                finally:
+                    pool.close()
+                    pool.join()
 
-                for proc in processes:
-                    proc.join()
-
-                filtered_df = pd.concat(returned_frames)
+                filtered_df = dataframe_copy[np.concatenate(returned_masks)]
 
             else:
                 # perform filter sequentiually if num_procs = 1
@@ -489,9 +677,11 @@ class GraphFrame:
             elif issubclass(type(filter_obj), AbstractQuery):
                 query = filter_obj._get_new_query()
             query_matches = self.query_engine.apply(query, self.graph, self.dataframe)
-            # match_set = list(set().union(*query_matches))
-            # filtered_df = dataframe_copy.loc[dataframe_copy["node"].isin(match_set)]
-            filtered_df = dataframe_copy.loc[dataframe_copy["node"].isin(query_matches)]
+            # select the matching rows of the dataframe directly, the
+            # boolean indexing makes a new dataframe
+            filtered_df = self.dataframe[
+                _node_mask(self.dataframe.index, query_matches)
+            ]
         else:
             raise InvalidFilter(
                 "The argument passed to filter must be a callable, a query path list, or a QueryMatcher object."
@@ -502,7 +692,8 @@ class GraphFrame:
                 "The provided filter would have produced an empty GraphFrame."
             )
 
-        filtered_df.set_index(index_names, inplace=True)
+        if callable(filter_obj):
+            filtered_df.set_index(index_names, inplace=True)
 
         filtered_gf = GraphFrame(self.graph, filtered_df)
         filtered_gf.exc_metrics = self.exc_metrics
@@ -527,22 +718,21 @@ class GraphFrame:
         self.dataframe.reset_index(inplace=True)
 
         # create new nodes for each unique node in the old dataframe
-        old_to_new = {n: n.copy() for n in set(self.dataframe["node"])}
+        old_to_new = {n: n.copy() for n in self.dataframe["node"].unique()}
         for i in old_to_new:
             old_to_new[i]._hatchet_nid = i._hatchet_nid
 
         # Maintain sets of connections to make for each old node.
         # Start with old -> new mapping and update as we traverse subgraphs.
-        connections = defaultdict(lambda: set())
-        connections.update({k: {v} for k, v in old_to_new.items()})
+        connections = {k: {v} for k, v in old_to_new.items()}
 
         new_roots = []  # list of new roots
 
         # connect new nodes to children according to transitive
         # relationships in the old graph.
-        def rewire(node, new_parent, visited):
+        def connect(node, new_parent):
             # make all transitive connections for the node we're visiting
-            for n in connections[node]:
+            for n in connections.get(node, ()):
                 if new_parent:
                     # there is a parent in the new graph; connect it
                     if n not in new_parent.children:
@@ -553,56 +743,81 @@ class GraphFrame:
                     # this is a new root
                     new_roots.append(n)
 
-            new_node = old_to_new.get(node)
-            transitive = set()
-            if node not in visited:
-                visited.add(node)
-                for child in node.children:
-                    transitive |= rewire(child, new_node or new_parent, visited)
+        def rewire(root, visited):
+            # Depth-first traversal with an explicit stack, so deep graphs do
+            # not hit Python's recursion limit. Each entry holds the old node,
+            # its counterpart in the new graph (if any), the parent to connect
+            # its children to, the iterator over children still to visit, and
+            # the new nodes transitively reachable through visited children.
+            def enter(node, new_parent):
+                connect(node, new_parent)
+                new_node = old_to_new.get(node)
+                if node in visited:
+                    children = iter(())
+                else:
+                    visited.add(node)
+                    children = iter(node.children)
+                return (node, new_node, new_node or new_parent, children, set())
+
+            stack = [enter(root, None)]
+            while stack:
+                node, new_node, child_parent, children, transitive = stack[-1]
+                child = next(children, None)
+                if child is not None:
+                    stack.append(enter(child, child_parent))
+                    continue
 
-            if new_node:
-                # since new_node exists in the squashed graph, we only
-                # need to connect new_node
-                return {new_node}
-            else:
-                # connect parents to the first transitively reachable
-                # new_nodes of nodes we're removing with this squash
-                connections[node] |= transitive
-                return connections[node]
+                stack.pop()
+                if new_node:
+                    # since new_node exists in the squashed graph, we only
+                    # need to connect new_node
+                    returned = {new_node}
+                else:
+                    # connect parents to the first transitively reachable
+                    # new_nodes of nodes we're removing with this squash
+                    returned = connections.setdefault(node, set())
+                    returned |= transitive
+
+                if stack:
+                    stack[-1][-1].update(returned)
 
         # run rewire for each root and make a new graph
         visited = set()
         for root in self.graph.roots:
-            rewire(root, None, visited)
+            rewire(root, visited)
         graph = Graph(new_roots)
         graph.enumerate_traverse()
 
         # reindex new dataframe with new nodes
         df = self.dataframe.copy()
-        df["node"] = df["node"].apply(lambda x: old_to_new[x])
+        df["node"] = df["node"].map(old_to_new)
 
         # at this point, the graph is potentially invalid, as some nodes
         # may have children with identical frames.
         merges = graph.normalize()
-        df["node"] = df["node"].apply(lambda n: merges.get(n, n))
+        if merges:
+            df["node"] = df["node"].map(merges).fillna(df["node"])
 
         self.dataframe.set_index(index_names, inplace=True)
         df.set_index(index_names, inplace=True)
-        # create dict that stores aggregation function for each column
-        agg_dict = {}
-        for col in df.columns.tolist():
-            if col in self.exc_metrics + self.inc_metrics:
-                # use min_count=1 (default is 0) here, so sum of an all-NA
-                # series is NaN, not 0
-                # when min_count=1, sum([NaN, NaN)] = NaN
-                # when min_count=0, sum([NaN, NaN)] = 0
-                agg_dict[col] = lambda x: x.sum(min_count=1)
-            else:
-                agg_dict[col] = lambda x: x.iloc[0]
-
-        # perform a groupby to merge nodes with the same callpath
-        agg_df = df.groupby(index_names).agg(agg_dict)
-        agg_df.sort_index(inplace=True)
+        columns = df.columns.tolist()
+        metrics = [c for c in columns if c in self.exc_metrics + self.inc_metrics]
+        others = [c for c in columns if c not in metrics]
+
+        # perform a groupby to merge nodes with the same callpath: metrics are
+        # summed, other columns keep the value of the first row of each group.
+        # use min_count=1 (default is 0) here, so sum of an all-NA
+        # series is NaN, not 0
+        # when min_count=1, sum([NaN, NaN)] = NaN
+        # when min_count=0, sum([NaN, NaN)] = 0
+        agg_df = df.groupby(index_names, observed=True)[metrics].sum(
+            min_count=1, numeric_only=False
+        )
+        first_df = _first_rows(df, others, df.index, agg_df.index)
+        agg_df = pd.concat([agg_df, first_df], axis=1)[columns]
+        # groupby sorts the groups already
+        if not agg_df.index.is_monotonic_increasing:
+            agg_df.sort_index(inplace=True)
 
         # put it all together
         new_gf = GraphFrame(
@@ -617,6 +832,25 @@ class GraphFrame:
             new_gf.update_inclusive_columns()
         return new_gf
 
+    def downcast_metrics(self, dtype=np.float32):
+        """Store floating point metric columns with a smaller dtype.
+
+        Profile data rarely needs double precision. Single precision halves
+        the memory used by metric columns, and ``subtree_sum`` and
+        ``subgraph_sum`` then also accumulate in single precision. The
+        arithmetic operators keep single precision when both graphframes are
+        downcast. Integer and non-numeric metric columns are left unchanged.
+
+        Arguments:
+            dtype (numpy dtype, optional): floating point dtype to convert
+                the metric columns to (default: np.float32)
+        """
+        for col in self.exc_metrics + self.inc_metrics:
+            if col in self.dataframe.columns and pd.api.types.is_float_dtype(
+                self.dataframe[col]
+            ):
+                self.dataframe[col] = self.dataframe[col].astype(dtype)
+
     def _init_sum_columns(self, columns, out_columns):
         """Helper function for subtree_sum and subgraph_sum."""
         if out_columns is None:
@@ -631,9 +865,114 @@ class GraphFrame:
 
         return out_columns
 
-    def subtree_sum(
-        self, columns, out_columns=None, function=lambda x: x.sum(min_count=1)
-    ):
+    def _is_numeric(self, columns):
+        """True if all columns are numeric."""
+        return all(
+            pd.api.types.is_numeric_dtype(self.dataframe[col]) for col in columns
+        )
+
+    def _node_rows(self, rank=0, thread=0):
+        """Map each node to the position of its row in the dataframe.
+
+        Only rows with the given rank and thread are considered, if these are
+        levels of the index. If a node still has several rows, the first one
+        is used. Positions are only valid until the dataframe is modified.
+        """
+        index = self.dataframe.index
+        mask = np.ones(len(index), dtype=bool)
+        if "rank" in index.names:
+            mask &= index.get_level_values("rank") == rank
+        if "thread" in index.names:
+            mask &= index.get_level_values("thread") == thread
+
+        positions = np.flatnonzero(mask)
+        nodes = index.get_level_values("node")[positions]
+
+        # insert in reverse, so that the first row of each node wins
+        return dict(zip(nodes[::-1], positions[::-1].tolist()))
+
+    def _sum_rows(self, nodes=None):
+        """Helper function for subtree_sum and subgraph_sum.
+
+        Maps each row of the dataframe to a (node, non-node index value)
+        coordinate, so that rows can be found by integer position instead of
+        label lookups. Nodes are numbered in traversal order of the graph,
+        pass ``nodes`` if the caller has traversed the graph already.
+        """
+        if nodes is None:
+            nodes = list(self.graph.traverse())
+        node_pos = {id(node): i for i, node in enumerate(nodes)}
+
+        index = self.dataframe.index
+        row_nodes = np.fromiter(
+            (node_pos.get(id(n), -1) for n in index.get_level_values("node")),
+            dtype=np.intp,
+            count=len(index),
+        )
+        if isinstance(index, pd.MultiIndex):
+            row_groups, groups = index.droplevel("node").factorize()
+            num_groups = max(len(groups), 1)
+        else:
+            row_groups = np.zeros(len(index), dtype=np.intp)
+            num_groups = 1
+
+        # rows whose node is not in the graph are left alone
+        in_graph = row_nodes >= 0
+        positions = np.full((len(nodes), num_groups), -1, dtype=np.intp)
+        positions[row_nodes[in_graph], row_groups[in_graph]] = np.flatnonzero(in_graph)
+
+        return SumRows(
+            node_pos, row_nodes[in_graph], row_groups[in_graph], in_graph, positions
+        )
+
+    def _gather_sum_values(self, columns, nodes=None):
+        """Helper function for subtree_sum and subgraph_sum.
+
+        Gathers columns into a dense float array of shape (nodes in the
+        graph, unique non-node index values, columns), so sums can be
+        computed with integer indexing instead of dataframe lookups. Entries
+        without a row in the dataframe are NaN. The array is single precision
+        if all columns are (see ``downcast_metrics``), double otherwise.
+
+        Return:
+            rows (SumRows): position of each dataframe row in the array
+            values (ndarray): the gathered values
+        """
+        rows = self._sum_rows(nodes)
+
+        if all(self.dataframe[col].dtype == np.float32 for col in columns):
+            dtype = np.float32
+        else:
+            dtype = np.float64
+
+        values = np.full(rows.positions.shape + (len(columns),), np.nan, dtype=dtype)
+        values[rows.nodes, rows.groups] = self.dataframe[columns].to_numpy(
+            dtype=dtype, na_value=np.nan
+        )[rows.in_graph]
+
+        return rows, values
+
+    def _scatter_sum_values(self, out_columns, rows, result):
+        """Helper function for subtree_sum and subgraph_sum.
+
+        Stores an array laid out by _gather_sum_values into out_columns.
+        Float columns keep their dtype, and so do integer columns unless the
+        result contains NaN.
+        """
+        for j, col in enumerate(out_columns):
+            dtype = self.dataframe[col].dtype
+            new_data = self.dataframe[col].to_numpy(
+                dtype=result.dtype, na_value=np.nan, copy=True
+            )
+            new_data[rows.in_graph] = result[rows.nodes, rows.groups, j]
+            self.dataframe[col] = new_data
+            if pd.api.types.is_float_dtype(dtype) or (
+                pd.api.types.is_integer_dtype(dtype) and not np.isnan(new_data).any()
+            ):
+                if self.dataframe[col].dtype != dtype:
+                    self.dataframe[col] = self.dataframe[col].astype(dtype)
+
+    def subtree_sum(self, columns, out_columns=None, function=_sum_min_count):
         """Compute sum of elements in subtrees.  Valid only for trees.
 
         For each row in the graph, ``out_columns`` will contain the
@@ -654,46 +993,68 @@ class GraphFrame:
         """
         out_columns = self._init_sum_columns(columns, out_columns)
 
+        if function is _sum_min_count and self._is_numeric(out_columns):
+            nodes = list(self.graph.traverse(order="post"))
+            rows, values = self._gather_sum_values(out_columns, nodes)
+            child_pos, indptr = _children_csr(nodes, rows.node_pos)
+
+            # Group nodes by height above their deepest descendant. Nodes of
+            # the same height do not descend from one another, so going up
+            # one height at a time, the sums of all their children are final
+            # and can be added in one reduceat. Nodes are in post-order, so
+            # children get their height before their parents.
+            heights = [0] * len(nodes)
+            for i, node in enumerate(nodes):
+                if node.children:
+                    heights[i] = 1 + max(
+                        heights[rows.node_pos[id(c)]] for c in node.children
+                    )
+            heights = np.array(heights, dtype=np.intp)
+            by_height = np.argsort(heights, kind="stable")
+            height_starts = np.searchsorted(
+                heights[by_height], np.arange(heights.max(initial=0) + 2)
+            )
+
+            # accumulate sums and non-NA counts bottom-up, so that nodes and
+            # groups without any value stay NaN as with sum(min_count=1)
+            counts = (~np.isnan(values)).astype(np.intp)
+            sums = np.where(np.isnan(values), 0.0, values)
+            with np.errstate(invalid="ignore"):  # inf + -inf is NaN, as in pandas
+                for h in range(1, len(height_starts) - 1):
+                    parents = by_height[height_starts[h] : height_starts[h + 1]]
+                    entries, starts = _csr_entries(indptr, parents)
+                    children = child_pos[entries]
+                    sums[parents] += np.add.reduceat(sums[children], starts, axis=0)
+                    counts[parents] += np.add.reduceat(counts[children], starts, axis=0)
+            sums[counts == 0] = np.nan
+
+            self._scatter_sum_values(out_columns, rows, sums)
+            return
+
+        # look up rows by position rather than by (node, rank, thread) label
+        rows = self._sum_rows()
+        out_idx = [self.dataframe.columns.get_loc(col) for col in out_columns]
+
         # sum over the output columns
         for node in self.graph.traverse(order="post"):
             if node.children:
-                # TODO: need a better way of aggregating inclusive metrics when
-                # TODO: there is a multi-index
-                try:
-                    is_multi_index = isinstance(
-                        self.dataframe.index, pd.core.index.MultiIndex
-                    )
-                except AttributeError:
-                    is_multi_index = isinstance(self.dataframe.index, pd.MultiIndex)
-
-                if is_multi_index:
-                    for rank_thread in self.dataframe.loc[
-                        (node), out_columns
-                    ].index.unique():
-                        # rank_thread is either rank or a tuple of (rank, thread).
-                        # We check if rank_thread is a tuple and if it is, we
-                        # create a tuple of (node, rank, thread). If not, we create
-                        # a tuple of (node, rank).
-                        if isinstance(rank_thread, tuple):
-                            df_index1 = (node,) + rank_thread
-                            df_index2 = ([node] + node.children,) + rank_thread
-                        else:
-                            df_index1 = (node, rank_thread)
-                            df_index2 = ([node] + node.children, rank_thread)
-
-                        for col in out_columns:
-                            self.dataframe.loc[df_index1, col] = function(
-                                self.dataframe.loc[df_index2, col]
-                            )
-                else:
-                    for col in out_columns:
-                        self.dataframe.loc[node, col] = function(
-                            self.dataframe.loc[[node] + node.children, col]
+                # row positions of node and its children, with one column per
+                # rank or (rank, thread), and -1 where there is no row. Without
+                # a multi-index, there is a single column.
+                positions = rows.positions[
+                    [rows.node_pos[id(n)] for n in [node] + node.children]
+                ]
+
+                for rank_thread in np.flatnonzero(positions[0] >= 0):
+                    df_rows = positions[:, rank_thread]
+                    df_rows = df_rows[df_rows >= 0]
+
+                    for j in out_idx:
+                        self.dataframe.iat[df_rows[0], j] = function(
+                            self.dataframe.iloc[df_rows, j]
                         )
 
-    def subgraph_sum(
-        self, columns, out_columns=None, function=lambda x: x.sum(min_count=1)
-    ):
+    def subgraph_sum(self, columns, out_columns=None, function=_sum_min_count):
         """Compute sum of elements in subgraphs.
 
         For each row in the graph, ``out_columns`` will contain the
@@ -705,6 +1066,12 @@ class GraphFrame:
         is not a particularly efficient algorithm known for subgraph
         sums, so this does about as well as we know how.
 
+        With the default ``function`` and numeric columns, the graph is
+        condensed into its strongly connected components, the set of
+        components reachable from each component is built as a bitset in
+        one reverse topological pass, and all sums are computed as one
+        matrix product instead of one dataframe lookup per node.
+
         Arguments:
             columns (list of str):  names of columns to sum (default: all columns)
             out_columns (list of str): names of columns to store results
@@ -712,46 +1079,111 @@ class GraphFrame:
             function (callable): associative operator used to sum
                 elements, sum of an all-NA series is NaN (default: sum(min_count=1))
         """
-        if self.graph.is_tree():
+        # traverse the graph once, both to check whether it is a tree (as
+        # Graph.is_tree does) and to number its nodes for the row lookups
+        visited = {}
+        nodes = list(self.graph.traverse(visited=visited))
+        if len(self.graph.roots) == 1 and all(v == 1 for v in visited.values()):
             self.subtree_sum(columns, out_columns, function)
             return
 
         out_columns = self._init_sum_columns(columns, out_columns)
-        for node in self.graph.traverse():
-            subgraph_nodes = list(node.traverse())
-            # TODO: need a better way of aggregating inclusive metrics when
-            # TODO: there is a multi-index
-            try:
-                is_multi_index = isinstance(
-                    self.dataframe.index, pd.core.index.MultiIndex
-                )
-            except AttributeError:
-                is_multi_index = isinstance(self.dataframe.index, pd.MultiIndex)
-
-            if is_multi_index:
-                for rank_thread in self.dataframe.loc[
-                    (node), out_columns
-                ].index.unique():
-                    # rank_thread is either rank or a tuple of (rank, thread).
-                    # We check if rank_thread is a tuple and if it is, we
-                    # create a tuple of (node, rank, thread). If not, we create
-                    # a tuple of (node, rank).
-                    if isinstance(rank_thread, tuple):
-                        df_index1 = (node,) + rank_thread
-                        df_index2 = (subgraph_nodes,) + rank_thread
-                    else:
-                        df_index1 = (node, rank_thread)
-                        df_index2 = (subgraph_nodes, rank_thread)
 
-                    for col in out_columns:
-                        self.dataframe.loc[df_index1, col] = [
-                            function(self.dataframe.loc[df_index2, col])
-                        ]
-            else:
+        if function is _sum_min_count and self._is_numeric(columns):
+            rows, values = self._gather_sum_values(columns, nodes)
+
+            components = self.graph.strongly_connected_components()
+            node_component = np.empty(len(values), dtype=np.intp)
+            for c, component in enumerate(components):
+                for node in component:
+                    node_component[rows.node_pos[id(node)]] = c
+
+            # Per component, sum the finite values and count the non-NA,
+            # +inf and -inf values. Infinities are counted rather than summed
+            # since the matrix product below would turn 0 * inf into NaN.
+            num_components = len(components)
+            channels = np.stack(
+                [
+                    np.where(np.isfinite(values), values, 0.0),
+                    ~np.isnan(values),
+                    values == np.inf,
+                    values == -np.inf,
+                ]
+            )
+            component_channels = np.zeros(
+                (num_components,) + channels[0].shape[1:] + (4,), dtype=values.dtype
+            )
+            np.add.at(component_channels, node_component, np.moveaxis(channels, 0, -1))
+
+            # components are in reverse topological order, so the components
+            # reachable from a component's children are known before it.
+            reachable = np.zeros(
+                (num_components, (num_components + 7) // 8), dtype=np.uint8
+            )
+            for c, component in enumerate(components):
+                reachable[c, c // 8] |= np.uint8(0x80 >> (c % 8))
+                for node in component:
+                    for child in node.children:
+                        child_c = node_component[rows.node_pos[id(child)]]
+                        if child_c != c:
+                            reachable[c] |= reachable[child_c]
+
+            # sum over reachable components in blocks to bound memory use
+            component_channels = component_channels.reshape(num_components, -1)
+            totals = np.empty_like(component_channels)
+            for start in range(0, num_components, 1024):
+                block = np.unpackbits(
+                    reachable[start : start + 1024], axis=1, count=num_components
+                ).astype(values.dtype)
+                totals[start : start + 1024] = block @ component_channels
+            totals = totals.reshape((num_components,) + values.shape[1:] + (4,))
+
+            sums, counts, pos_inf, neg_inf = np.moveaxis(totals, -1, 0)
+            sums[pos_inf > 0] = np.inf
+            sums[neg_inf > 0] = -np.inf
+            sums[(counts == 0) | ((pos_inf > 0) & (neg_inf > 0))] = np.nan
+
+            result = sums[node_component]
+            self._scatter_sum_values(out_columns, rows, result)
+            return
+
+        # look up rows by position rather than by (node, rank, thread) label
+        rows = self._sum_rows(nodes)
+        in_idx = [self.dataframe.columns.get_loc(col) for col in columns]
+        out_idx = [self.dataframe.columns.get_loc(col) for col in out_columns]
+
+        # TODO: need a better way of aggregating inclusive metrics when
+        # TODO: there is a multi-index
+        if isinstance(self.dataframe.index, pd.MultiIndex):
+            for node in nodes:
+                # row positions of the subgraph's nodes, with one column per
+                # rank or (rank, thread), and -1 where there is no row
+                positions = rows.positions[
+                    [rows.node_pos[id(n)] for n in node.traverse()]
+                ]
+
+                for rank_thread in np.flatnonzero(positions[0] >= 0):
+                    df_rows = positions[:, rank_thread]
+                    df_rows = df_rows[df_rows >= 0]
+
+                    for j in out_idx:
+                        self.dataframe.iat[df_rows[0], j] = function(
+                            self.dataframe.iloc[df_rows, j]
+                        )
+        else:
+            for node in nodes:
+                # row positions of the subgraph's nodes, -1 where there is no row
+                df_rows = rows.positions[
+                    [rows.node_pos[id(n)] for n in node.traverse()], 0
+                ]
+                if df_rows[0] < 0:
+                    continue
+                df_rows = df_rows[df_rows >= 0]
+
                 # TODO: if you take the list constructor away from the
                 # TODO: assignment below, this assignment gives NaNs. Why?
-                self.dataframe.loc[(node), out_columns] = list(
-                    function(self.dataframe.loc[(subgraph_nodes), columns])
+                self.dataframe.iloc[df_rows[0], out_idx] = list(
+                    function(self.dataframe.iloc[df_rows, in_idx])
                 )
 
     def generate_exclusive_columns(self):
@@ -788,58 +1220,61 @@ class GraphFrame:
             # suffix) to the generation list.
             else:
                 generation_pairs.append((inc + " (exc)", inc))
-        # Consider each new exclusive metric and its corresponding inclusive metric
-        for exc, inc in generation_pairs:
-            # Process of obtaining inclusive data for a node differs if the DataFrame has an Index vs a MultiIndex
+        if generation_pairs:
+            # Children of each node, in compressed sparse row form over the
+            # node positions of the arrays built by _gather_sum_values: the
+            # children of nodes[i] are child_pos[indptr[i]:indptr[i + 1]].
+            # A node's exclusive value is its inclusive value minus the
+            # inclusive values of its children.
+            nodes = list(self.graph.traverse())
+            node_pos = {id(node): i for i, node in enumerate(nodes)}
+            child_pos, indptr = _children_csr(nodes, node_pos)
+            # reduceat cannot produce empty sums, so only reduce over nodes
+            # with children
+            parents = np.flatnonzero(np.diff(indptr))
+
+            # Rows whose node is not in the graph get NaN with a MultiIndex
+            # and -1 otherwise
             if isinstance(self.dataframe.index, pd.MultiIndex):
-                new_data = {}
-                # Traverse every node in the Graph
-                for node in self.graph.traverse():
-                    # Consider each unique portion of the MultiIndex corresponding to the current node
-                    for non_node_idx in self.dataframe.loc[(node)].index.unique():
-                        # If there's only 1 index level besides "node", add it to a 1-element list to ensure consistent typing
-                        if not isinstance(non_node_idx, tuple) and not isinstance(
-                            non_node_idx, list
-                        ):
-                            non_node_idx = [non_node_idx]
-                        # Build the full index
-                        # TODO: Replace the full_idx assignment with the following when 2.7 support
-                        # is dropped:
-                        # full_idx = (node, *non_node_idx)
-                        full_idx = tuple([node]) + tuple(non_node_idx)
-                        # Iterate over the children of the current node and add up
-                        # their values for the inclusive metric
-                        inc_sum = 0
-                        for child in node.children:
-                            # TODO: See note about full_idx above
-                            child_idx = tuple([child]) + tuple(non_node_idx)
-                            inc_sum += self.dataframe.loc[child_idx, inc]
-                        # Subtract the current node's inclusive metric from the previously calculated sum to
-                        # get the exclusive metric value for the node
-                        new_data[full_idx] = self.dataframe.loc[full_idx, inc] - inc_sum
-                # Add the exclusive metric as a new column in the DataFrame
-                self.dataframe = self.dataframe.assign(
-                    **{exc: pd.Series(data=new_data)}
-                )
+                fill_value = np.nan
             else:
-                # Create a basic Node-metric dict for the new exclusive metric
-                new_data = {n: -1 for n in self.dataframe.index.values}
-                # Traverse the graph
-                for node in self.graph.traverse():
-                    # Sum up the inclusive metric values of the current node's children
-                    inc_sum = 0
-                    for child in node.children:
-                        inc_sum += self.dataframe.loc[child, inc]
-                    # Subtract the current node's inclusive metric from the previously calculated sum to
-                    # get the exclusive metric value for the node
-                    new_data[node] = self.dataframe.loc[node, inc] - inc_sum
-                # Add the exclusive metric as a new column in the DataFrame
-                self.dataframe = self.dataframe.assign(
-                    **{exc: pd.Series(data=new_data)}
+                fill_value = -1
+
+            # Gather all inclusive metrics at once, so that the children's
+            # values are summed in one pass and the dataframe is copied once
+            inc_columns = [inc for _, inc in generation_pairs]
+            rows, values = self._gather_sum_values(inc_columns, nodes)
+
+            # sum up the inclusive metric values of each node's children,
+            # for each rank or (rank, thread). Missing child rows and NaN
+            # values make the sum NaN.
+            inc_sum = np.zeros_like(values)
+            if len(parents):
+                inc_sum[parents] = np.add.reduceat(
+                    values[child_pos], indptr[parents], axis=0
                 )
+
+            new_data = np.full(
+                (len(self.dataframe), len(inc_columns)), fill_value, dtype=values.dtype
+            )
+            new_data[rows.in_graph] = (values - inc_sum)[rows.nodes, rows.groups]
+
+            # Consider each new exclusive metric and its corresponding inclusive metric
+            new_columns = {}
+            for j, (exc, inc) in enumerate(generation_pairs):
+                # integer metrics stay integers unless values are missing
+                dtype = self.dataframe[inc].dtype
+                column = new_data[:, j]
+                if pd.api.types.is_integer_dtype(dtype) and not np.isnan(column).any():
+                    column = column.astype(dtype)
+                new_columns[exc] = column
+
+            # Add the exclusive metrics as new columns in the DataFrame
+            self.dataframe = self.dataframe.assign(**new_columns)
+
         # Add the newly created metrics to self.exc_metrics
         self.exc_metrics.extend([metric_tuple[0] for metric_tuple in generation_pairs])
-        self.exc_metrics = list(set(self.exc_metrics))
+        self.exc_metrics = list(dict.fromkeys(self.exc_metrics))
 
     def update_inclusive_columns(self):
         """Update inclusive columns (typically after operations that rewire the
@@ -872,7 +1307,7 @@ class GraphFrame:
         self.inc_metrics = new_inc_metrics
 
         self.subgraph_sum(self.exc_metrics, self.inc_metrics)
-        self.inc_metrics = list(set(self.inc_metrics + old_inc_metrics))
+        self.inc_metrics = list(dict.fromkeys(self.inc_metrics + old_inc_metrics))
 
     def show_metric_columns(self):
         """Returns a list of dataframe column labels."""
@@ -898,14 +1333,31 @@ class GraphFrame:
         self.dataframe.reset_index(inplace=True)
         other.dataframe.reset_index(inplace=True)
 
-        self.dataframe["node"] = self.dataframe["node"].apply(lambda x: node_map[id(x)])
-        other.dataframe["node"] = other.dataframe["node"].apply(
-            lambda x: node_map[id(x)]
-        )
+        def map_nodes(nodes):
+            # node_map is keyed by id(), so look up each distinct node once
+            codes, uniques = pd.factorize(nodes)
+            new_nodes = np.empty(len(uniques), dtype=object)
+            new_nodes[:] = [node_map[id(n)] for n in uniques]
+            return codes, new_nodes
+
+        self_codes, self_nodes = map_nodes(self.dataframe["node"])
+        other_codes, other_nodes = map_nodes(other.dataframe["node"])
+        self.dataframe["node"] = self_nodes[self_codes]
+        other.dataframe["node"] = other_nodes[other_codes]
+
+        # rows whose node also appears in the other dataframe, found once per
+        # distinct node of the union graph rather than by hashing every row
+        def in_nodes(nodes, codes, other_nodes):
+            other_ids = set(map(id, other_nodes))
+            return np.array([id(n) in other_ids for n in nodes], dtype=bool)[codes]
 
         # add missing rows to copy of self's dataframe in preparation for
         # operation
-        self._insert_missing_rows(other)
+        self._insert_missing_rows(
+            other,
+            in_nodes(self_nodes, self_codes, other_nodes),
+            in_nodes(other_nodes, other_codes, self_nodes),
+        )
 
         self.dataframe.set_index(self_index_names, inplace=True, drop=True)
         other.dataframe.set_index(other_index_names, inplace=True, drop=True)
@@ -988,135 +1440,76 @@ class GraphFrame:
         """Write the graph in the folded stack output required by FlameGraph
         http://www.brendangregg.com/flamegraphs.html
         """
-        folded_stack = ""
+        folded_stack = []
         if metric is None:
             metric = self.default_metric
 
+        rows = self._node_rows(rank, thread)
+        names = self.dataframe["name"].to_numpy()
+        values = self.dataframe[metric].to_numpy()
+
         for root in self.graph.roots:
+            # folded callpath of each node, extended by its children
+            prefixes = {}
             for hnode in root.traverse():
-                callpath = hnode.path()
-                for i in range(0, len(callpath) - 1):
-                    if (
-                        "rank" in self.dataframe.index.names
-                        and "thread" in self.dataframe.index.names
-                    ):
-                        df_index = (callpath[i], rank, thread)
-                    elif "rank" in self.dataframe.index.names:
-                        df_index = (callpath[i], rank)
-                    elif "thread" in self.dataframe.index.names:
-                        df_index = (callpath[i], thread)
-                    else:
-                        df_index = callpath[i]
-                    folded_stack = (
-                        folded_stack + str(self.dataframe.loc[df_index, "name"]) + "; "
-                    )
-
-                if (
-                    "rank" in self.dataframe.index.names
-                    and "thread" in self.dataframe.index.names
-                ):
-                    df_index = (callpath[-1], rank, thread)
-                elif "rank" in self.dataframe.index.names:
-                    df_index = (callpath[-1], rank)
-                elif "thread" in self.dataframe.index.names:
-                    df_index = (callpath[-1], thread)
+                if len(hnode.parents) > 1:
+                    raise MultiplePathError("Node has more than one path: %s" % hnode)
+                if hnode.parents:
+                    prefix = prefixes[id(hnode.parents[0])]
                 else:
-                    df_index = callpath[-1]
-                folded_stack = (
-                    folded_stack + str(self.dataframe.loc[df_index, "name"]) + " "
-                )
+                    prefix = ""
 
-                # set dataframe index based on if rank and thread are part of the index
-                if (
-                    "rank" in self.dataframe.index.names
-                    and "thread" in self.dataframe.index.names
-                ):
-                    df_index = (hnode, rank, thread)
-                elif "rank" in self.dataframe.index.names:
-                    df_index = (hnode, rank)
-                elif "thread" in self.dataframe.index.names:
-                    df_index = (hnode, thread)
-                else:
-                    df_index = hnode
+                row = rows[hnode]
+                node_name = str(names[row])
+                prefixes[id(hnode)] = prefix + node_name + "; "
 
-                folded_stack = (
-                    folded_stack
-                    + str(round(self.dataframe.loc[df_index, metric]))
-                    + "\n"
+                folded_stack.extend(
+                    (prefix, node_name, " ", str(round(values[row])), "\n")
                 )
 
-        return folded_stack
+        return "".join(folded_stack)
 
     def to_literal(self, name="name", rank=0, thread=0, cat_columns=[]):
         """Format this graph as a list of dictionaries for Roundtrip
         visualizations.
         """
         graph_literal = []
-        visited = []
+        visited = set()
+        rows = self._node_rows(rank, thread)
+        columns = self.dataframe.columns
 
-        def _get_df_index(hnode):
-            if (
-                "rank" in self.dataframe.index.names
-                and "thread" in self.dataframe.index.names
-            ):
-                df_index = (hnode, rank, thread)
-            elif "rank" in self.dataframe.index.names:
-                df_index = (hnode, rank)
-            elif "thread" in self.dataframe.index.names:
-                df_index = (hnode, thread)
-            else:
-                df_index = hnode
-
-            return df_index
-
-        def metrics_to_dict(df_index):
-            metrics_dict = {}
-            for m in sorted(self.inc_metrics + self.exc_metrics):
-                node_metric_val = self.dataframe.loc[df_index, m]
-                if isinstance(node_metric_val, pd.Series):
-                    node_metric_val = node_metric_val[0]
-                if np.isinf(node_metric_val) or np.isneginf(node_metric_val):
-                    node_metric_val = 0.0
-                if pd.isna(node_metric_val):
-                    node_metric_val = 0.0
-                metrics_dict[m] = node_metric_val
-
-            return metrics_dict
-
-        def attributes_to_dict(df_index):
-            valid_columns = [
-                col for col in cat_columns if col in self.dataframe.columns
-            ]
+        # inf and NaN metric values are reported as 0
+        metrics = sorted(set(self.inc_metrics + self.exc_metrics))
+        metric_values = (
+            self.dataframe[metrics].replace([np.inf, -np.inf], 0.0).fillna(0.0)
+        )
+        metric_values = [(m, metric_values[m].to_numpy()) for m in metrics]
+
+        attributes = sorted(set(col for col in cat_columns if col in columns))
+        attribute_values = [(m, self.dataframe[m].to_numpy()) for m in attributes]
 
-            attributes_dict = {}
-            for m in sorted(valid_columns):
-                node_attr_val = self.dataframe.loc[df_index, m]
-                if isinstance(node_attr_val, pd.Series):
-                    node_attr_val = node_attr_val[0]
-                attributes_dict[m] = node_attr_val
+        def metrics_to_dict(row):
+            return {m: values[row] for m, values in metric_values}
 
-            return attributes_dict
+        def attributes_to_dict(row):
+            return {m: values[row] for m, values in attribute_values}
 
         def add_nodes(hnode):
-            df_index = _get_df_index(hnode)
+            row = rows[hnode]
 
             node_dict = {}
 
-            node_name = self.dataframe.loc[df_index, name]
-
-            if isinstance(node_name, pd.Series):
-                self.dataframe.loc[df_index]
-                node_name = node_name[0]
+            node_name = self.dataframe.iat[row, columns.get_loc(name)]
 
             node_dict["name"] = node_name
             node_dict["frame"] = hnode.frame.attrs
-            node_dict["metrics"] = metrics_to_dict(df_index)
+            node_dict["metrics"] = metrics_to_dict(row)
             # node_dict["metrics"]["_hatchet_nid"] = int(self.dataframe["nid"][df_index])
             node_dict["metrics"]["_hatchet_nid"] = int(hnode._hatchet_nid)
-            node_dict["attributes"] = attributes_to_dict(df_index)
+            node_dict["attributes"] = attributes_to_dict(row)
 
             if hnode.children and hnode not in visited:
-                visited.append(hnode)
+                visited.add(hnode)
                 node_dict["children"] = []
 
                 for child in sorted(hnode.children, key=lambda n: n.frame):
@@ -1149,8 +1542,23 @@ class GraphFrame:
 
         hatchet_dict["dataframe_indices"] = list(self.dataframe.index.names)
         ef = self.dataframe.reset_index()
-        ef["node"] = ef["node"].apply(lambda n: n._hatchet_nid)
-        hatchet_dict["dataframe"] = ef.replace({np.nan: None}).to_dict("records")
+        nodes = ef["node"].to_numpy()
+        ef["node"] = np.fromiter(
+            (n._hatchet_nid for n in nodes), dtype=np.int64, count=len(nodes)
+        )
+        ef = ef.replace({np.nan: None})
+
+        # build the records from whole columns, which is faster than
+        # to_dict("records"). Like to_dict, return python scalars only.
+        columns = []
+        for col in ef.columns:
+            values = ef[col].tolist()
+            if ef[col].dtype == object:
+                values = [v.item() if isinstance(v, np.generic) else v for v in values]
+            columns.append(values)
+        hatchet_dict["dataframe"] = [
+            dict(zip(ef.columns, row)) for row in zip(*columns)
+        ]
 
         hatchet_dict["inclusive_metrics"] = self.inc_metrics
         hatchet_dict["exclusive_metrics"] = self.exc_metrics
@@ -1160,14 +1568,14 @@ class GraphFrame:
     def to_json(self):
         return json.dumps(self.to_dict())
 
-    def _operator(self, other, op):
+    def _operator(self, other, name):
         """Generic function to apply operator to two dataframes and store
         result in self.
 
         Arguments:
             self (graphframe): self's graphframe
             other (graphframe): other's graphframe
-            op (operator): pandas arithmetic operator
+            name (str): name of the pandas arithmetic operator (e.g., "add")
 
         Return:
             (GraphFrame): self's graphframe modified
@@ -1178,17 +1586,95 @@ class GraphFrame:
                 self.exc_metrics, self.inc_metrics, other.exc_metrics, other.inc_metrics
             )
         )
-
-        self.dataframe.update(op(other.dataframe[all_metrics]))
+        other_metrics = other.dataframe[all_metrics]
+        dataframe = self.dataframe
+
+        if dataframe.index.equals(other_metrics.index):
+            # rows already match, so apply the ufunc to each numeric column
+            # instead of going through pandas' alignment and dispatch
+            ufunc = _OPERATOR_UFUNCS[name]
+            results = {}
+            # pandas does not warn on division by zero either
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                for metric in all_metrics:
+                    if metric not in dataframe.columns:
+                        continue
+                    column = dataframe[metric]
+                    other_column = other_metrics[metric]
+                    old = column.to_numpy()
+                    if column.dtype.kind in "iuf" and other_column.dtype.kind in "iuf":
+                        values = ufunc(old, other_column.to_numpy())
+                    else:
+                        values = getattr(column, name)(other_column).to_numpy()
+                    missing = pd.isna(values)
+                    if missing.any():
+                        values = np.where(missing, old, values)
+                    results[metric] = values
+
+            if len(results) > _OPERATOR_MAX_SETITEM:
+                # replacing a column copies the rest of its dtype block, so
+                # for wide frames build the new dataframe once instead
+                self.dataframe = pd.DataFrame(
+                    {
+                        col: results.get(col, dataframe[col])
+                        for col in dataframe.columns
+                    },
+                    index=dataframe.index,
+                    columns=dataframe.columns,
+                    copy=False,
+                )
+            else:
+                for metric, values in results.items():
+                    dataframe[metric] = values
+            return self
+
+        result = getattr(self.dataframe, name)(other_metrics)
+        if result.index.equals(self.dataframe.index):
+            # rows are already aligned, so assign directly instead of going
+            # through update's reindexing. Like update, NaN results do not
+            # overwrite existing values.
+            for metric in all_metrics:
+                if metric not in self.dataframe.columns:
+                    continue
+                values = result[metric].to_numpy()
+                missing = pd.isna(values)
+                if missing.any():
+                    values = np.where(
+                        missing, self.dataframe[metric].to_numpy(), values
+                    )
+                self.dataframe[metric] = values
+        else:
+            self.dataframe.update(result)
 
         return self
 
-    def _insert_missing_rows(self, other):
+    def _apply_operator(self, other, name):
+        """Unify self with other, then apply the dataframe operator called
+        name (e.g., "add") and store the result in self. Other is not modified.
+
+        Return:
+            (GraphFrame): self's graphframe modified
+        """
+        # unify has nothing to do if the graph is shared, and _operator only
+        # reads other, so other is only copied when it will be rewritten
+        if self.graph is not other.graph:
+            other = other.copy()
+            self.unify(other)
+
+        return self._operator(other, name)
+
+    def _insert_missing_rows(self, other, self_in_other=None, other_in_self=None):
         """Helper function to add rows that exist in other, but not in self.
 
         This returns a graphframe with a modified dataframe. The new rows will
         contain zeros for numeric columns.
 
+        Arguments:
+            self_in_other (ndarray, optional): mask of self's rows whose node
+                is in other's dataframe, computed if not given
+            other_in_self (ndarray, optional): mask of other's rows whose node
+                is in self's dataframe, computed if not given
+
         Return:
             (GraphFrame): self's modified graphframe
         """
@@ -1198,51 +1684,16 @@ class GraphFrame:
             )
         )
 
-        # make two 2D nparrays arrays with two columns:
-        # 1) the hashed value of a node and 2) a numerical index
-        # Many operations are stacked here to reduce the need for storing
-        # large intermediary datasets
-        self_hsh_ndx = np.vstack(
-            (
-                np.array(
-                    [x.__hash__() for x in self.dataframe["node"]], dtype=np.uint64
-                ),
-                self.dataframe.index.values.astype(np.uint64),
-            )
-        ).T
-        other_hsh_ndx = np.vstack(
-            (
-                np.array(
-                    [x.__hash__() for x in other.dataframe["node"]], dtype=np.uint64
-                ),
-                other.dataframe.index.values.astype(np.uint64),
-            )
-        ).T
-
-        # sort our 2D arrays by hashed node value so a binary search can be used
-        # in the cython function fast_not_isin
-        self_hsh_ndx_sorted = self_hsh_ndx[self_hsh_ndx[:, 0].argsort()]
-        other_hsh_ndx_sorted = other_hsh_ndx[other_hsh_ndx[:, 0].argsort()]
+        if self_in_other is None:
+            self_in_other = self.dataframe["node"].isin(other.dataframe["node"])
+        if other_in_self is None:
+            other_in_self = other.dataframe["node"].isin(self.dataframe["node"])
 
         # get nodes that exist in other, but not in self, set metric columns to 0 for
         # these rows
-        other_not_in_self = other.dataframe[
-            _gfm_cy.fast_not_isin(
-                other_hsh_ndx_sorted,
-                self_hsh_ndx_sorted,
-                other_hsh_ndx_sorted.shape[0],
-                self_hsh_ndx_sorted.shape[0],
-            )
-        ]
+        other_not_in_self = other.dataframe[~other_in_self]
         # get nodes that exist in self, but not in other
-        self_not_in_other = self.dataframe[
-            _gfm_cy.fast_not_isin(
-                self_hsh_ndx_sorted,
-                other_hsh_ndx_sorted,
-                self_hsh_ndx_sorted.shape[0],
-                other_hsh_ndx_sorted.shape[0],
-            )
-        ]
+        self_not_in_other = self.dataframe[~self_in_other]
 
         # if there are missing nodes in either self or other, add a new column
         # called _missing_node
@@ -1253,7 +1704,7 @@ class GraphFrame:
         if not other_not_in_self.empty:
             # initialize with 2 to save filling in later
             other_not_in_self = other_not_in_self.assign(
-                _missing_node=[int(2) for x in range(len(other_not_in_self))]
+                _missing_node=np.full(len(other_not_in_self), 2, dtype=np.short)
             )
 
             # add a new column to self if other has nodes not in self
@@ -1274,9 +1725,7 @@ class GraphFrame:
             # This function adds 1 to all nodes in self.dataframe['_missing_node'] which
             # are in self but not in the other graphframe
             _gfm_cy.insert_one_for_self_nodes(snio_len, self_missing_node, snio_indices)
-            self.dataframe["_missing_node"] = np.array(
-                [n for n in self_missing_node], dtype=np.short
-            )
+            self.dataframe["_missing_node"] = self_missing_node
 
         # for nodes that only exist in other, set the metric to be nan (since
         # it's a missing node in self)
@@ -1418,14 +1867,7 @@ class GraphFrame:
         Return:
             (GraphFrame): new graphframe
         """
-        # create a copy of both graphframes
-        self_copy = self.copy()
-        other_copy = other.copy()
-
-        # unify copies of graphframes
-        self_copy.unify(other_copy)
-
-        return self_copy._operator(other_copy, self_copy.dataframe.add)
+        return self.copy()._apply_operator(other, "add")
 
     def sub(self, other):
         """Returns the column-wise difference of two graphframes as a new
@@ -1437,14 +1879,7 @@ class GraphFrame:
         Return:
             (GraphFrame): new graphframe
         """
-        # create a copy of both graphframes
-        self_copy = self.copy()
-        other_copy = other.copy()
-
-        # unify copies of graphframes
-        self_copy.unify(other_copy)
-
-        return self_copy._operator(other_copy, self_copy.dataframe.sub)
+        return self.copy()._apply_operator(other, "sub")
 
     def div(self, other):
         """Returns the column-wise float division of two graphframes as a new graphframe.
@@ -1455,14 +1890,7 @@ class GraphFrame:
         Return:
             (GraphFrame): new graphframe
         """
-        # create a copy of both graphframes
-        self_copy = self.copy()
-        other_copy = other.copy()
-
-        # unify copies of graphframes
-        self_copy.unify(other_copy)
-
-        return self_copy._operator(other_copy, self_copy.dataframe.divide)
+        return self.copy()._apply_operator(other, "divide")
 
     def mul(self, other):
         """Returns the column-wise float multiplication of two graphframes as a new graphframe.
@@ -1473,14 +1901,7 @@ class GraphFrame:
         Return:
             (GraphFrame): new graphframe
         """
-        # create a copy of both graphframes
-        self_copy = self.copy()
-        other_copy = other.copy()
-
-        # unify copies of graphframes
-        self_copy.unify(other_copy)
-
-        return self_copy._operator(other_copy, self_copy.dataframe.multiply)
+        return self.copy()._apply_operator(other, "multiply")
 
     def __iadd__(self, other):
         """Computes column-wise sum of two graphframes and stores the result in
@@ -1493,13 +1914,7 @@ class GraphFrame:
         Return:
             (GraphFrame): self's graphframe modified
         """
-        # create a copy of other's graphframe
-        other_copy = other.copy()
-
-        # unify self graphframe and copy of other graphframe
-        self.unify(other_copy)
-
-        return self._operator(other_copy, self.dataframe.add)
+        return self._apply_operator(other, "add")
 
     def __add__(self, other):
         """Returns the column-wise sum of two graphframes as a new graphframe.
@@ -1534,13 +1949,7 @@ class GraphFrame:
         Return:
             (GraphFrame): self's graphframe modified
         """
-        # create a copy of other's graphframe
-        other_copy = other.copy()
-
-        # unify self graphframe and other graphframe
-        self.unify(other_copy)
-
-        return self._operator(other_copy, self.dataframe.sub)
+        return self._apply_operator(other, "sub")
 
     def __sub__(self, other):
         """Returns the column-wise difference of two graphframes as a new
@@ -1565,13 +1974,7 @@ class GraphFrame:
         Return:
             (GraphFrame): self's graphframe modified
         """
-        # create a copy of other's graphframe
-        other_copy = other.copy()
-
-        # unify self graphframe and other graphframe
-        self.unify(other_copy)
-
-        return self._operator(other_copy, self.dataframe.div)
+        return self._apply_operator(other, "div")
 
     def __truediv__(self, other):
         """Returns the column-wise float division of two graphframes as a new
@@ -1596,13 +1999,7 @@ class GraphFrame:
         Return:
             (GraphFrame): self's graphframe modified
         """
-        # create a copy of other's graphframe
-        other_copy = other.copy()
-
-        # unify self graphframe and other graphframe
-        self.unify(other_copy)
-
-        return self._operator(other_copy, self.dataframe.mul)
+        return self._apply_operator(other, "mul")
 
 
 class InvalidFilter(Exception):
@@ -89,3 +89,26 @@ def test_trees_are_trees():
         ("a", ("b", "e", "f", "g"), ("c", "e", "f", "g"), ("d", "e", "f", "g"))
     )
     assert g.is_tree()
+
+
+def test_strongly_connected_components():
+    d = Node(Frame(name="d"))
+    g = Graph.from_lists(("a", ("b", d), ("c", d)))
+    components = g.strongly_connected_components()
+
+    # a DAG has one component per node, children before parents
+    assert [[n.frame["name"] for n in c] for c in components] == [
+        ["d"],
+        ["b"],
+        ["c"],
+        ["a"],
+    ]
+
+    # close a cycle b -> d -> b
+    b = g.roots[0].children[0]
+    d.add_child(b)
+    b.add_parent(d)
+    components = g.strongly_connected_components()
+    assert len(components) == 3
+    assert set(n.frame["name"] for n in components[0]) == {"b", "d"}
+    assert components[-1][0].frame["name"] == "a"
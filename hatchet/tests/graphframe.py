@@ -8,12 +8,15 @@
 from __future__ import division
 
 import os
+import subprocess
+import sys
 
 import pytest
 
 import numpy as np
 import pandas as pd
 
+import hatchet
 from hatchet import GraphFrame, QueryMatcher
 from hatchet.graphframe import InvalidFilter, EmptyFilter
 from hatchet.frame import Frame
@@ -526,6 +529,103 @@ def test_filter_squash_mock_literal(mock_graph_literal):
     assert len(filtered_squashed_gf.graph) == 7
 
 
+def test_filter_vectorized_mock_literal(mock_graph_literal):
+    """Test that a vectorized filter matches the row-wise filter."""
+    gf = GraphFrame.from_literal(mock_graph_literal)
+
+    rowwise_gf = gf.filter(lambda x: x["time"] > 5.0, squash=False, num_procs=1)
+    vectorized_gf = gf.filter(
+        lambda df: df["time"] > 5.0, squash=False, vectorized=True
+    )
+    assert vectorized_gf.dataframe.equals(rowwise_gf.dataframe)
+
+    filtered_squashed_gf = gf.filter(lambda df: df["time"] > 5.0, vectorized=True)
+    assert len(filtered_squashed_gf.graph) == 7
+
+    # the filter must return one boolean per row, not a scalar
+    with pytest.raises(InvalidFilter):
+        gf.filter(lambda df: True, vectorized=True)
+
+
+def test_filter_parallel_mock_literal(mock_graph_literal):
+    """Test that parallel filters match the sequential filter."""
+    gf = GraphFrame.from_literal(mock_graph_literal)
+
+    sequential_gf = gf.filter(lambda x: x["time"] > 5.0, squash=False, num_procs=1)
+    parallel_gf = gf.filter(lambda x: x["time"] > 5.0, squash=False, num_procs=3)
+    assert parallel_gf.dataframe.equals(sequential_gf.dataframe)
+
+    # more processes than rows leaves some processes with empty slices
+    gf = GraphFrame.from_lists(("a", ("b", "c"), ("d", "e")))
+    sequential_gf = gf.filter(lambda x: x["name"] != "c", squash=False, num_procs=1)
+    parallel_gf = gf.filter(lambda x: x["name"] != "c", squash=False, num_procs=8)
+    assert parallel_gf.dataframe.equals(sequential_gf.dataframe)
+
+
+def test_filter_numba_mock_literal(mock_graph_literal):
+    """Test that a numba-compiled filter matches the row-wise filter."""
+    pytest.importorskip("numba")
+    gf = GraphFrame.from_literal(mock_graph_literal)
+
+    rowwise_gf = gf.filter(lambda x: x["time"] > 5.0, squash=False, num_procs=1)
+    numba_gf = gf.filter(lambda time: time > 5.0, squash=False, engine="numba")
+    assert numba_gf.dataframe.equals(rowwise_gf.dataframe)
+
+    with pytest.raises(ValueError):
+        gf.filter(lambda not_a_column: not_a_column > 5.0, engine="numba")
+
+    # only numeric and boolean columns can be passed to a numba filter
+    with pytest.raises(ValueError):
+        gf.filter(lambda name: name == "foo", engine="numba")
+
+    # columns whose names are not valid identifiers are passed explicitly
+    rowwise_gf = gf.filter(lambda x: x["time (inc)"] > 50.0, squash=False, num_procs=1)
+    numba_gf = gf.filter(
+        lambda t: t > 50.0,
+        squash=False,
+        engine="numba",
+        engine_kwargs={"columns": ["time (inc)"]},
+    )
+    assert numba_gf.dataframe.equals(rowwise_gf.dataframe)
+
+    with pytest.raises(ValueError):
+        gf.filter(
+            lambda t: t > 50.0,
+            engine="numba",
+            engine_kwargs={"columns": ["time (inc)", "time"]},
+        )
+
+
+def test_filter_numba_then_fork():
+    """Test that a numba filter does not hang later forked processes."""
+    pytest.importorskip("numba")
+    script = "\n".join(
+        [
+            "from hatchet import GraphFrame",
+            "gf = GraphFrame.from_lists(('a', ('b', 'c'), ('d', 'e')))",
+            "gf.filter(lambda time: time > 0.0, squash=False, engine='numba')",
+            "gf.filter(lambda x: x['time'] > 0.0, squash=False, num_procs=4)",
+        ]
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(hatchet.__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    # raises subprocess.TimeoutExpired if the interpreter hangs at exit
+    subprocess.run([sys.executable, "-c", script], env=env, check=True, timeout=120)
+
+
+def test_filter_numba_kernel_cache():
+    """Test that equivalent numba predicates reuse the compiled kernel."""
+    pytest.importorskip("numba")
+    from hatchet.util.numba_kernels import generate_filter_kernel
+
+    def make_predicate(threshold):
+        return lambda time: time > threshold
+
+    kernel = generate_filter_kernel(make_predicate(5.0), 1)
+    assert generate_filter_kernel(make_predicate(5.0), 1) is kernel
+    assert generate_filter_kernel(make_predicate(6.0), 1) is not kernel
+
+
 def test_filter_no_squash_mock_literal_multi_subtree_merge(mock_graph_literal):
     gf = GraphFrame.from_literal(mock_graph_literal)
     gf.drop_index_levels()
@@ -1263,3 +1363,24 @@ def test_generate_exclusive_columns_w_multi_index(calc_pi_hpct_db):
     gf_time.generate_exclusive_columns()
     assert "time (exc)" in gf_time.exc_metrics
     assert gf.dataframe["time"].equals(gf_time.dataframe["time (exc)"])
+
+
+def test_downcast_metrics(mock_graph_literal):
+    gf = GraphFrame.from_literal(mock_graph_literal)
+    expected = gf.dataframe["time (inc)"].to_numpy()
+
+    gf.downcast_metrics()
+    assert gf.dataframe["time"].dtype == np.float32
+    assert gf.dataframe["time (inc)"].dtype == np.float32
+
+    # sums are accumulated and stored in single precision
+    gf.subgraph_sum(["time"], ["time (inc)"])
+    assert gf.dataframe["time (inc)"].dtype == np.float32
+    assert np.allclose(gf.dataframe["time (inc)"].to_numpy(), expected)
+
+    # arithmetic operators keep single precision, with and without unify
+    other = GraphFrame.from_literal(mock_graph_literal)
+    other.downcast_metrics()
+    for result in (gf - gf, gf - other, other.filter(lambda x: x["time"] > 5) * gf):
+        assert result.dataframe["time"].dtype == np.float32
+        assert result.dataframe["time (inc)"].dtype == np.float32
@@ -39,20 +39,20 @@ def to_dot(hnode, dataframe, metric, name, rank, thread, threshold, visited):
     min_time = dataframe[metric].min()
     max_time = dataframe[metric].max()
 
-    def add_nodes_and_edges(hnode):
+    # set dataframe index based on if rank and thread are part of the index
+    index_levels = tuple(
+        value
+        for level, value in (("rank", rank), ("thread", thread))
+        if level in dataframe.index.names
+    )
 
-        # set dataframe index based on if rank is a part of the index
-        if "rank" in dataframe.index.names and "thread" in dataframe.index.names:
-            df_index = (hnode, rank, thread)
-        elif "rank" in dataframe.index.names:
-            df_index = (hnode, rank)
-        elif "thread" in dataframe.index.names:
-            df_index = (hnode, thread)
-        else:
-            df_index = hnode
+    def df_index(node):
+        return (node,) + index_levels if index_levels else node
 
-        node_time = dataframe.loc[df_index, metric]
-        node_name = dataframe.loc[df_index, name]
+    def add_nodes_and_edges(hnode):
+        node_index = df_index(hnode)
+        node_time = dataframe.loc[node_index, metric]
+        node_name = dataframe.loc[node_index, name]
         node_id = hnode._hatchet_nid
 
         weight = (node_time - min_time) / (max_time - min_time)
@@ -69,19 +69,7 @@ def to_dot(hnode, dataframe, metric, name, rank, thread, threshold, visited):
             # threshold
             children = []
             for child in hnode.children:
-                if (
-                    "rank" in dataframe.index.names
-                    and "thread" in dataframe.index.names
-                ):
-                    df_index = (child, rank, thread)
-                elif "rank" in dataframe.index.names:
-                    df_index = (child, rank)
-                elif "thread" in dataframe.index.names:
-                    df_index = (child, thread)
-                else:
-                    df_index = child
-
-                child_time = dataframe.loc[df_index, metric]
+                child_time = dataframe.loc[df_index(child), metric]
                 if child_time >= threshold * max_time:
                     children.append(child)
 
@@ -0,0 +1,134 @@
+# Copyright 2017-2023 Lawrence Livermore National Security, LLC and other
+# Hatchet Project Developers. See the top-level LICENSE file for details.
+#
+# SPDX-License-Identifier: MIT
+
+import inspect
+from collections import OrderedDict
+
+import numpy as np
+
+# compiled filter kernels, keyed by the behavior of the predicate (see
+# _predicate_key) and bounded so that old kernels are eventually released
+_filter_kernels = OrderedDict()
+_FILTER_KERNELS_MAXSIZE = 32
+
+
+def import_numba():
+    """Import numba lazily, since it is an optional dependency of hatchet."""
+    try:
+        import numba
+    except ImportError:
+        raise ImportError(
+            "numba is required for engine='numba'. Install it with "
+            "`pip install numba` or `pip install llnl-hatchet[numba]`."
+        )
+    return numba
+
+
+def get_arg_names(func):
+    """Return the names of the positional arguments of func.
+
+    For numba dispatchers, the signature of the wrapped python function is
+    used.
+    """
+    py_func = getattr(func, "py_func", func)
+    return list(inspect.signature(py_func).parameters)
+
+
+def _predicate_key(func):
+    """Return a hashable key describing what func computes, or None.
+
+    Two predicates with the same code, default arguments, closure values and
+    module globals compile to the same kernel, so ``lambda time: time > 5.0``
+    written anew on every call still hits the cache. If any of these values is
+    not hashable, the predicate cannot be cached and None is returned.
+    """
+    py_func = getattr(func, "py_func", func)
+    try:
+        closure = tuple(c.cell_contents for c in (py_func.__closure__ or ()))
+        key = (
+            py_func.__code__,
+            py_func.__defaults__,
+            closure,
+            id(py_func.__globals__),
+        )
+        hash(key)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return key
+
+
+def _compile_filter_kernel(func, num_args, nopython, nogil, parallel):
+    numba = import_numba()
+
+    if hasattr(func, "py_func"):
+        # already a numba dispatcher
+        numba_func = func
+    else:
+        numba_func = numba.extending.register_jitable(func)
+
+    # numba cannot jit functions with variable arguments, so generate a
+    # kernel with exactly one array argument per column
+    args = ", ".join("col%d" % i for i in range(num_args))
+    row = ", ".join("col%d[i]" % i for i in range(num_args))
+    source = (
+        "def filter_kernel({args}):\n"
+        "    n = len(col0)\n"
+        "    result = np.empty(n, dtype=np.bool_)\n"
+        "    for i in numba.prange(n):\n"
+        "        result[i] = numba_func({row})\n"
+        "    return result\n"
+    ).format(args=args, row=row)
+
+    namespace = {"np": np, "numba": numba, "numba_func": numba_func}
+    exec(source, namespace)
+
+    return numba.jit(nopython=nopython, nogil=nogil, parallel=parallel)(
+        namespace["filter_kernel"]
+    )
+
+
+def generate_filter_kernel(func, num_args, nopython=True, nogil=True, parallel=False):
+    """Compile a kernel that evaluates a scalar predicate over columns.
+
+    The returned kernel takes ``num_args`` 1D arrays of equal length and
+    returns a boolean array with the result of ``func`` applied to each row.
+
+    Kernels are cached by the predicate's code, default arguments, closure
+    values and module, so repeated filters with an equivalent predicate only
+    pay the compilation cost once. Predicates whose closure holds unhashable values
+    (e.g., arrays) are recompiled on every call.
+
+    Note that numba treats global variables read by the predicate as
+    compile-time constants. Changing such a global after the first call has
+    no effect on the cached kernel; pass the value through a closure or a
+    default argument instead.
+
+    Arguments:
+        func (callable): predicate taking ``num_args`` scalars and returning
+            a boolean. It must be compilable in numba's nopython mode.
+        num_args (int): number of columns passed to the predicate
+        nopython, nogil, parallel (bool): options passed to ``numba.jit``.
+            ``parallel`` is off by default: numba's threading layer is not
+            fork-safe, and hatchet forks processes in ``filter`` and in its
+            readers, which then hang at interpreter exit.
+
+    Return:
+        (callable): compiled kernel
+    """
+    key = _predicate_key(func)
+    if key is None:
+        return _compile_filter_kernel(func, num_args, nopython, nogil, parallel)
+
+    key = (key, num_args, nopython, nogil, parallel)
+    kernel = _filter_kernels.get(key)
+    if kernel is None:
+        kernel = _compile_filter_kernel(func, num_args, nopython, nogil, parallel)
+        _filter_kernels[key] = kernel
+        if len(_filter_kernels) > _FILTER_KERNELS_MAXSIZE:
+            _filter_kernels.popitem(last=False)
+    else:
+        _filter_kernels.move_to_end(key)
+
+    return kernel
@@ -118,6 +118,9 @@ setup(
         "multiprocess",
         "caliper-reader",
     ],
+    extras_require={
+        "numba": ["numba"],
+    },
     ext_modules=ext_modules,
     cmdclass=cmd_class,
 )